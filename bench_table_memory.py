@@ -0,0 +1,267 @@
+import gc
+import multiprocessing
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+from war_game_server import TableState, create_deck, send_msg
+from war_table_server import TableServer
+
+TABLE_COUNTS = [1000, 10000, 100000]
+HIBERNATED_TABLES = 10000
+HIBERNATE_BATCH = 1000
+TARGET_TABLES = 100000
+# Threads each WarGameServer still runs for its one table: two client
+# handlers, the heartbeat monitor, the extra-client rejecter and the UDP
+# broadcaster (game_loop runs on the main thread).
+THREADS_PER_TABLE = 5
+SAMPLE_THREADS = 200
+LIVE_TABLES = 500
+
+def legacy_table(deck):
+    """Per-table state as WarGameServer used to hold it, for comparison."""
+    return {
+        "client_names": [None, None],
+        "stacks": [deque(deck[:26]), deque(deck[26:])],
+        "winning_piles": [deque(), deque()],
+        "ready_flags": [threading.Event(), threading.Event()],
+        "heartbeat_times": [time.time(), time.time()],
+        "reconnect_deadlines": [None, None],
+        "current_round": 0,
+    }
+
+def compact_table(deck):
+    table = TableState()
+    table.deal(deck)
+    return table
+
+def bytes_per_table(make_table, count):
+    deck = create_deck()
+    random.shuffle(deck)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tables = [make_table(deck) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del tables
+    return (after - before) / count
+
+def process_memory():
+    """Resident and virtual size of this process in bytes, or None off Linux."""
+    try:
+        with open('/proc/self/status') as f:
+            fields = dict(line.split(':', 1) for line in f)
+    except OSError:
+        return None
+    return (int(fields['VmRSS'].split()[0]) * 1024,
+            int(fields['VmSize'].split()[0]) * 1024)
+
+def thread_cost(count):
+    """Resident and virtual bytes per idle thread, measured over count threads."""
+    stop = threading.Event()
+    before = process_memory()
+    threads = [threading.Thread(target=stop.wait, daemon=True) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    after = process_memory()
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if before is None or after is None:
+        return None
+    return (after[0] - before[0]) / count, (after[1] - before[1]) / count
+
+def loopback_server():
+    """A TableServer on a free loopback port, spilling to a temporary directory."""
+    server = TableServer(host='127.0.0.1', port=0)
+    server.spill_dir = tempfile.mkdtemp()
+    return server
+
+def close_server(server):
+    server.close()
+    for name in os.listdir(server.spill_dir):
+        os.remove(os.path.join(server.spill_dir, name))
+    os.rmdir(server.spill_dir)
+
+def timed_ms(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return (time.perf_counter() - start) * 1000
+
+def quietly(fn, *args):
+    # Keep the server's log lines out of the report
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        return fn(*args)
+
+def in_fresh_process(fn, *args):
+    """Run fn in a newly spawned process, so memory freed here can't skew its RSS."""
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(quietly, fn, *args).result()
+
+def server_stats(count):
+    """Seat count idle tables in one TableServer and measure the whole process.
+
+    Tables are opened without sockets, so this is the server's own cost per
+    table: its TableState, table record and seat entries. Returns (resident
+    bytes per table, threads the server added, sweep ms, poll ms).
+    """
+    threads = threading.active_count()
+    server = loopback_server()
+    gc.collect()
+    before = process_memory()
+    try:
+        for n in range(count):
+            server.open_table([None, None], [f"{n}a", f"{n}b"])
+        gc.collect()
+        after = process_memory()
+        threads = threading.active_count() - threads
+        sweep = timed_ms(server.sweep, time.time())
+        server.next_sweep = time.time() + 60
+        poll = timed_ms(server.poll, 0)
+    finally:
+        close_server(server)
+    rss = None if before is None else (after[0] - before[0]) / count
+    return rss, threads, sweep, poll
+
+def live_stats(count):
+    """Play a round on count tables with real loopback players.
+
+    The players' sockets live in this process too, so the resident figure is
+    an upper bound. Returns (resident bytes per table, threads the server
+    added, round ms).
+    """
+    threads = threading.active_count()
+    server = loopback_server()
+    players = []
+    gc.collect()
+    before = process_memory()
+    try:
+        for n in range(count):
+            for name in (f"{n}a", f"{n}b"):
+                sock = socket.create_connection(('127.0.0.1', server.port))
+                send_msg(sock, {"type": "name", "name": name})
+                players.append(sock)
+            server.poll(0)
+        while len(server.tables) < count:
+            server.poll(0.01)
+        gc.collect()
+        after = process_memory()
+        threads = threading.active_count() - threads
+
+        start = time.perf_counter()
+        for sock in players:
+            send_msg(sock, "ready")
+        while any(table.state.current_round < 2 for table in server.tables.values()):
+            server.poll(0.01)
+        round_ms = (time.perf_counter() - start) * 1000
+    finally:
+        for sock in players:
+            sock.close()
+        close_server(server)
+    rss = None if before is None else (after[0] - before[0]) / count
+    return rss, threads, round_ms
+
+def hibernation_stats(count):
+    """Server RSS for count tables that go idle and hibernate, and wake-up latency.
+
+    Freed table state goes back to Python's allocator rather than the OS, so
+    RSS barely drops right after a sweep. The saving shows when later tables
+    reuse that memory: tables are opened and hibernated HIBERNATE_BATCH at a
+    time, as they would be on a busy server. Returns (resident bytes per
+    table just after hibernating the first batch, resident bytes per table
+    once all are hibernated, spill bytes per table, p50 and p99 wake-up ms).
+    """
+    server = loopback_server()
+    server.hibernate_after = 0
+    try:
+        gc.collect()
+        before = process_memory()
+        for start in range(0, count, HIBERNATE_BATCH):
+            for n in range(start, min(start + HIBERNATE_BATCH, count)):
+                server.open_table([None, None], [f"{n}a", f"{n}b"])
+            if not start:
+                gc.collect()
+                first = process_memory()
+            server.sweep(time.time())
+            if not start:
+                gc.collect()
+                first_after = process_memory()
+        gc.collect()
+        after = process_memory()
+        paths = [server.spill_path(table_id) for table_id in server.tables]
+        spill_bytes = sum(os.path.getsize(path) for path in paths) / count
+
+        latencies = []
+        for table_id, table in server.tables.items():
+            start = time.perf_counter()
+            server.wake_table(table_id, table)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        close_server(server)
+    latencies.sort()
+    if before is None:
+        dropped = hibernated = None
+    else:
+        dropped = (first[0] - first_after[0]) / min(count, HIBERNATE_BATCH)
+        hibernated = (after[0] - before[0]) / count
+    return (dropped, hibernated, spill_bytes,
+            latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)])
+
+def main():
+    print(f"{'tables':>8} {'legacy B/table':>15} {'compact B/table':>16}")
+    for count in TABLE_COUNTS:
+        legacy = bytes_per_table(legacy_table, count)
+        compact = bytes_per_table(compact_table, count)
+        print(f"{count:>8} {legacy:>15.0f} {compact:>16.0f}")
+
+    per_thread = thread_cost(SAMPLE_THREADS)
+    if per_thread is None:
+        print("\nThread cost: not measurable on this platform (no /proc)")
+    else:
+        rss, vsize = per_thread
+        table_rss = compact + THREADS_PER_TABLE * rss
+        print(f"\nWarGameServer, one process per table: {THREADS_PER_TABLE} threads per table at "
+              f"{rss:.0f} B resident and {vsize / 2**20:.1f} MiB of reserved stack each")
+        print(f"  {TARGET_TABLES} tables: {table_rss * TARGET_TABLES / 2**30:.1f} GiB resident, "
+              f"{THREADS_PER_TABLE * vsize * TARGET_TABLES / 2**30:.0f} GiB virtual, "
+              f"{THREADS_PER_TABLE * TARGET_TABLES} threads and as many listening ports")
+
+    print(f"\nTableServer, one selector loop for all tables:")
+    print(f"{'tables':>8} {'RSS B/table':>12} {'new threads':>12} {'sweep ms':>9} {'poll ms':>8}")
+    server_rss = {}
+    for count in TABLE_COUNTS:
+        rss, threads, sweep, poll = in_fresh_process(server_stats, count)
+        server_rss[count] = rss
+        shown = 'n/a' if rss is None else f"{rss:.0f}"
+        print(f"{count:>8} {shown:>12} {threads:>12} {sweep:>9.1f} {poll:>8.2f}")
+    if rss is not None:
+        print(f"  {count} idle tables: {rss * count / 2**20:.0f} MiB resident in one process and thread")
+
+    rss, threads, round_ms = in_fresh_process(live_stats, LIVE_TABLES)
+    rss = 'n/a' if rss is None else f"{rss:.0f} B"
+    print(f"\n{LIVE_TABLES} tables with live loopback players: {rss} resident per table "
+          f"(players included), {threads} new threads")
+    print(f"  one round on every table: {round_ms:.0f} ms")
+
+    dropped, hibernated, spill_bytes, p50, p99 = in_fresh_process(hibernation_stats, HIBERNATED_TABLES)
+    print(f"\nHibernating {HIBERNATED_TABLES} idle tables in a TableServer, {HIBERNATE_BATCH} at a time:")
+    if hibernated is not None:
+        print(f"  server RSS: {hibernated:.0f} B/table hibernated, "
+              f"{server_rss[HIBERNATED_TABLES]:.0f} B/table kept in memory (above)")
+        print(f"  RSS drop right after the first sweep: {dropped:.0f} B/table "
+              f"(freed memory stays with the allocator for reuse)")
+    print(f"  table state dropped: {compact:.0f} B/table (state only, tracemalloc)")
+    print(f"  on disk: {spill_bytes:.0f} B/table")
+    print(f"  wake-up latency: p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+if __name__ == '__main__':
+    main()
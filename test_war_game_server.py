@@ -0,0 +1,112 @@
+import os
+import socket
+import tempfile
+import unittest
+
+from war_game_server import TableState, WarGameServer, create_deck, encode_cards, recv_msg
+
+def dealt_table():
+    table = TableState()
+    table.deal(create_deck())
+    return table
+
+class TableStateSerializationTest(unittest.TestCase):
+    def assert_same_table(self, copy, table):
+        for field in TableState.__slots__:
+            self.assertEqual(getattr(copy, field), getattr(table, field), field)
+
+    def test_round_trip(self):
+        table = dealt_table()
+        deck = create_deck()
+        table.names = [None, 'Zoë ♠ 王']
+        table.stacks[0] = encode_cards(deck[:10])
+        table.winning_piles[0] = encode_cards(deck[10:30])
+        table.stacks[1] = bytearray()
+        table.winning_piles[1] = encode_cards(deck[30:])
+        table.set_ready(1)
+        table.request_odds(0)
+        table.current_round = 321
+        table.reconnect_deadlines[0] = 1234.5
+        self.assert_same_table(TableState.from_bytes(table.to_bytes()), table)
+
+    def test_save_and_load(self):
+        table = dealt_table()
+        table.names = ['Alice', 'Bob']
+        with tempfile.TemporaryDirectory() as spill_dir:
+            path = os.path.join(spill_dir, 'table.bin')
+            table.save(path)
+            self.assert_same_table(TableState.load(path), table)
+
+    def test_failed_save_removes_temporary_file(self):
+        table = dealt_table()
+        table.names = [5, None]
+        with tempfile.TemporaryDirectory() as spill_dir:
+            path = os.path.join(spill_dir, 'table.bin')
+            with self.assertRaises(AttributeError):
+                table.save(path)
+            self.assertEqual(os.listdir(spill_dir), [])
+
+class WakeTableTest(unittest.TestCase):
+    def setUp(self):
+        self.spill_dir = tempfile.TemporaryDirectory()
+        self.server = WarGameServer(host='127.0.0.1', port=0)
+        self.server.spill_dir = self.spill_dir.name
+        self.server.spill_path = os.path.join(self.spill_dir.name, 'table.bin')
+        self.server.table = dealt_table()
+        self.server.table.names = ['Alice', 'Bob']
+
+    def tearDown(self):
+        self.server.cleanup()
+        self.spill_dir.cleanup()
+
+    def test_hibernate_and_wake(self):
+        stacks = [bytes(cards) for cards in self.server.table.stacks]
+        self.server.hibernate_table()
+        self.assertIsNone(self.server.table)
+        self.assertTrue(os.path.exists(self.server.spill_path))
+        table = self.server.wake_table()
+        self.assertEqual([bytes(cards) for cards in table.stacks], stacks)
+        self.assertFalse(os.path.exists(self.server.spill_path))
+
+    def assert_table_lost(self):
+        self.assertIsNone(self.server.wake_table())
+        self.assertTrue(self.server.table_lost)
+        self.assertTrue(self.server.disconnected.is_set())
+
+    def test_wake_with_missing_spill_file(self):
+        self.server.hibernate_table()
+        os.remove(self.server.spill_path)
+        self.assert_table_lost()
+
+    def test_wake_with_corrupt_spill_file(self):
+        self.server.hibernate_table()
+        with open(self.server.spill_path, 'wb') as f:
+            f.write(b'\x00\x01')
+        self.assert_table_lost()
+
+class SendRoundResultTest(unittest.TestCase):
+    def setUp(self):
+        self.server = WarGameServer(host='127.0.0.1', port=0)
+        self.server.table = dealt_table()
+        self.players = []
+        for i in range(2):
+            server_end, client_end = socket.socketpair()
+            client_end.settimeout(5)
+            self.server.clients[i] = server_end
+            self.players.append(client_end)
+
+    def tearDown(self):
+        self.server.cleanup()
+        for sock in self.players:
+            sock.close()
+
+    def test_only_players_who_asked_get_odds(self):
+        self.server.table.request_odds(0)
+        round_result = {"type": "round_result", "round": 1}
+        self.server.send_round_result(round_result, (0.25, 0.75))
+        self.assertEqual(recv_msg(self.players[0])["odds"], (0.25, 0.75))
+        self.assertNotIn("odds", recv_msg(self.players[1]))
+        self.assertNotIn("odds", round_result)
+
+if __name__ == '__main__':
+    unittest.main()
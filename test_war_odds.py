@@ -0,0 +1,111 @@
+import time
+import unittest
+from concurrent.futures import Future
+
+import war_odds
+from war_game_server import TableState, create_deck, encode_cards
+
+def endgame_table(loser_cards):
+    """A dealt table where player 1 holds only loser_cards and player 0 the rest."""
+    table = TableState()
+    deck = create_deck()
+    table.stacks[0] = encode_cards([card for card in deck if card not in loser_cards])
+    table.stacks[1] = encode_cards(loser_cards)
+    return table
+
+class QueuedPool:
+    """Stands in for the process pool: records submitted work and never runs it."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.parts = []
+
+    def submit(self, fn, *args):
+        if self.fail:
+            raise RuntimeError("pool is broken")
+        part = Future()
+        self.parts.append(part)
+        return part
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+def midgame_values():
+    deck = [value for value in range(2, 15) for _ in range(4)]
+    return [bytes(deck[:26]), bytes(deck[26:])], [b'', b'']
+
+class ExactEndgameTest(unittest.TestCase):
+    def setUp(self):
+        self.table = endgame_table([('K', 'Diamonds'), ('4', 'Clubs')])
+        self.key = war_odds.state_key(*self.table.card_values())
+
+    def test_live_table_key_is_an_endgame(self):
+        self.assertEqual(sum(len(cards) for cards in self.key), 52)
+        engine = war_odds.OddsEngine(workers=1)
+        try:
+            self.assertTrue(engine.is_endgame(self.key))
+        finally:
+            engine.close()
+
+    def test_exact_odds_match_rollouts(self):
+        exact = war_odds._solve_exact(self.key, 5000)
+        self.assertIsNotNone(exact)
+        self.assertAlmostEqual(sum(exact), 1.0)
+        wins = war_odds._rollout_batch(self.key, 20000, 1, 5000)
+        self.assertAlmostEqual(exact[1], wins[1] / 20000, delta=0.005)
+
+    def test_engine_returns_exact_odds(self):
+        exact = war_odds._solve_exact(self.key, 5000)
+        engine = war_odds.OddsEngine(workers=1)
+        try:
+            self.assertEqual(engine.estimate(*self.table.card_values()), exact)
+        finally:
+            engine.close()
+
+    def test_large_refill_gives_up_quickly(self):
+        table = endgame_table([('Q', 'Spades'), ('A', 'Spades')])
+        key = war_odds.state_key(*table.card_values())
+        start = time.perf_counter()
+        self.assertIsNone(war_odds._solve_exact(key, 5000))
+        self.assertLess(time.perf_counter() - start, 5)
+
+class OddsEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.engine = war_odds.OddsEngine(workers=1)
+
+    def tearDown(self):
+        self.engine.close()
+
+    def test_failed_submit_fails_future_and_clears_pending(self):
+        self.engine.pool = QueuedPool(fail=True)
+        future = self.engine.submit(*midgame_values())
+        self.assertIsInstance(future.exception(), RuntimeError)
+        self.assertEqual(self.engine.pending, {})
+
+    def test_cached_query_skips_the_pool(self):
+        stacks, piles = midgame_values()
+        odds = self.engine.estimate(stacks, piles)
+        self.engine.pool.shutdown()
+        self.engine.pool = QueuedPool(fail=True)
+        future = self.engine.submit(stacks, piles)
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), odds)
+
+    def test_cancel_drops_queued_batches(self):
+        self.engine.pool.shutdown()
+        pool = self.engine.pool = QueuedPool()
+        future = self.engine.submit(*midgame_values())
+        self.assertEqual(len(pool.parts), self.engine.batches)
+        self.assertTrue(future.cancel())
+        self.assertTrue(all(part.cancelled() for part in pool.parts))
+        self.assertEqual(self.engine.pending, {})
+
+class SharedEngineTest(unittest.TestCase):
+    def test_one_engine_per_process(self):
+        engine = war_odds.shared_engine()
+        self.assertIs(war_odds.shared_engine(), engine)
+        odds = engine.estimate(*midgame_values())
+        self.assertEqual(war_odds.shared_engine().submit(*midgame_values()).result(timeout=0), odds)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import select
+import socket
+import tempfile
+import threading
+import unittest
+
+from war_game_server import recv_msg, send_msg
+from war_table_server import TableServer
+
+class TableServerTest(unittest.TestCase):
+    def setUp(self):
+        self.spill_dir = tempfile.TemporaryDirectory()
+        self.server = TableServer(host='127.0.0.1', port=0)
+        self.server.spill_dir = self.spill_dir.name
+        self.players = []
+
+    def tearDown(self):
+        for sock in self.players:
+            sock.close()
+        self.server.close()
+        self.spill_dir.cleanup()
+
+    def connect(self, name):
+        sock = socket.create_connection(('127.0.0.1', self.server.port))
+        sock.settimeout(5)
+        self.players.append(sock)
+        send_msg(sock, {"type": "name", "name": name})
+        return sock
+
+    def receive(self, sock):
+        """Run the server loop until sock has a message, then read it."""
+        for _ in range(500):
+            self.server.poll(0.01)
+            if select.select([sock], [], [], 0)[0]:
+                return recv_msg(sock)
+        self.fail("no message from the server")
+
+    def seat_pair(self, n=0):
+        alice, bob = self.connect(f"Alice {n}"), self.connect(f"Bob {n}")
+        self.assertEqual(self.receive(alice)["type"], "connected")
+        self.assertEqual(self.receive(alice)["type"], "game_start")
+        self.assertEqual(self.receive(bob)["type"], "connected")
+        self.assertEqual(self.receive(bob)["type"], "game_start")
+        return alice, bob
+
+    def test_plays_a_round(self):
+        alice, bob = self.seat_pair()
+        send_msg(alice, "odds")
+        send_msg(alice, "ready")
+        send_msg(bob, "ready")
+        results = [self.receive(alice), self.receive(bob)]
+        self.assertEqual([r["type"] for r in results], ["round_result", "round_result"])
+        self.assertEqual(results[0]["cards"], results[1]["cards"])
+        self.assertNotIn("odds", results[1])
+
+    def test_threads_do_not_grow_with_tables(self):
+        threads = set(threading.enumerate())
+        for n in range(20):
+            self.seat_pair(n)
+        self.assertEqual(len(self.server.tables), 20)
+        self.assertEqual(set(threading.enumerate()) - threads, set())
+
+    def test_idle_table_hibernates_and_wakes_on_ready(self):
+        alice, bob = self.seat_pair()
+        table = self.server.tables[0]
+        self.server.hibernate_after = 0
+        self.server.next_sweep = 0
+        self.server.poll(0)
+        self.assertIsNone(table.state)
+        self.server.hibernate_after = 30
+        send_msg(alice, "ready")
+        send_msg(bob, "ready")
+        self.assertEqual(self.receive(alice)["type"], "round_result")
+        self.assertIsNotNone(table.state)
+
+    def test_lost_spill_ends_only_that_table(self):
+        alice, bob = self.seat_pair(0)
+        carol, dave = self.seat_pair(1)
+        self.server.hibernate_table(0, self.server.tables[0])
+        self.server.spill_dir = self.spill_dir.name + '-missing'
+        send_msg(alice, "ready")
+        self.assertEqual(self.receive(alice)["type"], "game_end")
+        self.assertEqual(list(self.server.tables), [1])
+        send_msg(carol, "ready")
+        send_msg(dave, "ready")
+        self.assertEqual(self.receive(carol)["type"], "round_result")
+
+    def test_reconnect_resumes_seat(self):
+        alice, bob = self.seat_pair()
+        alice.close()
+        self.players.remove(alice)
+        for _ in range(10):
+            self.server.poll(0.01)
+        self.assertIsNone(self.server.tables[0].conns[0])
+
+        alice = self.connect("Alice 0")
+        resume = self.receive(alice)
+        self.assertEqual(resume["type"], "resume")
+        self.assertEqual(resume["player_index"], 0)
+        self.assertEqual(resume["opponent"], "Bob 0")
+
+    def test_expired_reconnect_window_ends_game(self):
+        alice, bob = self.seat_pair()
+        self.server.reconnect_timeout = 0
+        alice.close()
+        self.players.remove(alice)
+        self.server.sweep_interval = self.server.next_sweep = 0
+        message = self.receive(bob)
+        self.assertEqual(message["type"], "game_end")
+        self.assertIn("Bob 0 wins by default", message["message"])
+        self.assertEqual(self.server.tables, {})
+        self.assertEqual(self.server.seats, {})
+
+if __name__ == '__main__':
+    unittest.main()
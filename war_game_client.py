@@ -141,7 +141,7 @@ def main():
     game_over = False
     stack_size = 0
 
-    print("\nGame starting! Press Enter to play your next card, or type 'q' to quit.")
+    print("\nGame starting! Press Enter to play your next card, type 'o' to see live odds, or 'q' to quit.")
 
     while not game_over:
         # Get user input
@@ -151,6 +151,10 @@ def main():
                 if send_msg(client_socket, "shutdown"):
                     print("Requested server shutdown.")
                 break
+            if cmd.lower() == 'o':
+                if send_msg(client_socket, "odds"):
+                    print("Live odds will be shown with each round result.")
+                continue
         except (EOFError, KeyboardInterrupt):
             print("\nQuitting game...")
             send_msg(client_socket, "shutdown")
@@ -200,6 +204,10 @@ def main():
                             print(f"You play {my_card}, opponent plays {opp_card}. You WIN this round{war_text}! (+{pot_size} cards)")
                         else:
                             print(f"You play {my_card}, opponent plays {opp_card}. Opponent wins this round{war_text}. (-{pot_size} cards)")
+
+                    odds = msg.get("odds")
+                    if odds:
+                        print(f"Odds before this round: you {odds[player_index]:.0%}, opponent {odds[1 - player_index]:.0%}")
                     break
                     
                 elif msg_type == "game_end":
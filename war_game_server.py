@@ -1,10 +1,13 @@
+import os
 import socket
 import threading
 import random
 import pickle
 import struct
 import time
-from collections import deque
+from array import array
+
+from war_odds import shared_engine
 
 HOST = '0.0.0.0'
 PORT = 5555
@@ -20,6 +23,195 @@ def create_deck():
 def card_value(card):
     return CARD_VALUES[card[0]]
 
+# Cards are stored as one-byte codes: the card's index in a fresh deck.
+DECK = create_deck()
+CARD_CODES = {card: code for code, card in enumerate(DECK)}
+CODE_VALUES = bytes(card_value(card) for card in DECK)
+
+MAX_NAME_LENGTH = 32
+
+def valid_name(name):
+    """Whether a client-supplied name is usable (and fits the spill format)."""
+    if not isinstance(name, str) or not 0 < len(name.strip()) <= MAX_NAME_LENGTH:
+        return False
+    try:
+        name.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+def encode_cards(cards):
+    return bytearray(CARD_CODES[card] for card in cards)
+
+def decode_cards(codes):
+    return [DECK[code] for code in codes]
+
+class TableState:
+    """Game state of one table, kept small so idle tables are cheap to hold.
+
+    Stacks and winning piles are bytearrays of card codes, timestamps live in
+    double arrays (a reconnect deadline of 0.0 means none) and the ready flags
+    are a bitmask, so a table carries no threads, events or card tuples.
+    odds_wanted is a bitmask of the players who asked for live odds.
+    """
+    __slots__ = ('names', 'stacks', 'winning_piles', 'heartbeat_times',
+                 'reconnect_deadlines', 'ready', 'odds_wanted', 'current_round')
+
+    def __init__(self):
+        now = time.time()
+        self.names = [None, None]
+        self.stacks = [bytearray(), bytearray()]
+        self.winning_piles = [bytearray(), bytearray()]
+        self.heartbeat_times = array('d', (now, now))
+        self.reconnect_deadlines = array('d', (0.0, 0.0))
+        self.ready = 0
+        self.odds_wanted = 0
+        self.current_round = 0
+
+    def deal(self, deck):
+        self.stacks[0] = encode_cards(deck[:26])
+        self.stacks[1] = encode_cards(deck[26:])
+
+    def stack_cards(self, i):
+        return decode_cards(self.stacks[i])
+
+    def is_ready(self, i):
+        return bool(self.ready & (1 << i))
+
+    def set_ready(self, i):
+        self.ready |= 1 << i
+
+    def clear_ready(self, i):
+        self.ready &= ~(1 << i)
+
+    def refill_stack_if_needed(self, i):
+        if not self.stacks[i] and self.winning_piles[i]:
+            self.stacks[i] = self.winning_piles[i]
+            random.shuffle(self.stacks[i])
+            self.winning_piles[i] = bytearray()
+
+    def out_of_cards(self):
+        """Index of a player with no cards left, or None."""
+        for i in range(2):
+            if len(self.stacks[i]) == 0 and len(self.winning_piles[i]) == 0:
+                return i
+        return None
+
+    def play_round(self):
+        """Play one round from the top of both stacks.
+
+        Returns (cards, winner_idx, pot_size, war_count). If a player can't
+        go on with a war, cards is None and winner_idx is their opponent.
+        """
+        stacks = self.stacks
+        cards_in_play = [stacks[0].pop(0), stacks[1].pop(0)]
+        pot = bytearray(cards_in_play)
+
+        # Handle war (tie) situations
+        war_count = 0
+        while CODE_VALUES[cards_in_play[0]] == CODE_VALUES[cards_in_play[1]]:
+            war_count += 1
+            for i in range(2):
+                self.refill_stack_if_needed(i)
+                if len(stacks[i]) < 2:
+                    return None, 1 - i, len(pot), war_count
+
+                # Add face-down card and face-up card
+                pot.append(stacks[i].pop(0))  # Face down
+                cards_in_play[i] = stacks[i].pop(0)  # Face up
+                pot.append(cards_in_play[i])
+
+        winner_idx = 0 if CODE_VALUES[cards_in_play[0]] > CODE_VALUES[cards_in_play[1]] else 1
+        self.winning_piles[winner_idx].extend(pot)
+        return decode_cards(cards_in_play), winner_idx, len(pot), war_count
+
+    def request_odds(self, i):
+        self.odds_wanted |= 1 << i
+
+    def wants_odds(self, i):
+        return bool(self.odds_wanted & (1 << i))
+
+    def card_values(self):
+        """Stacks and winning piles as card values, the input of OddsEngine."""
+        stacks = [bytes(CODE_VALUES[code] for code in cards) for cards in self.stacks]
+        winning_piles = [bytes(CODE_VALUES[code] for code in cards) for cards in self.winning_piles]
+        return stacks, winning_piles
+
+    # Spill format: fixed header, two length-prefixed UTF-8 names (0xFFFF for
+    # no name), then both stacks and both winning piles as length-prefixed codes.
+    _HEADER = struct.Struct('>IBB4d')
+
+    def to_bytes(self):
+        parts = [self._HEADER.pack(self.current_round, self.ready, self.odds_wanted,
+                                   *self.heartbeat_times, *self.reconnect_deadlines)]
+        for name in self.names:
+            if name is None:
+                parts.append(struct.pack('>H', 0xFFFF))
+            else:
+                encoded = name.encode('utf-8')
+                parts.append(struct.pack('>H', len(encoded)) + encoded)
+        for cards in self.stacks + self.winning_piles:
+            parts.append(bytes((len(cards),)) + cards)
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        table = cls.__new__(cls)
+        fields = cls._HEADER.unpack_from(data)
+        table.current_round, table.ready, table.odds_wanted = fields[:3]
+        table.heartbeat_times = array('d', fields[3:5])
+        table.reconnect_deadlines = array('d', fields[5:7])
+        offset = cls._HEADER.size
+        table.names = []
+        for _ in range(2):
+            length = struct.unpack_from('>H', data, offset)[0]
+            offset += 2
+            if length == 0xFFFF:
+                table.names.append(None)
+            else:
+                table.names.append(data[offset:offset + length].decode('utf-8'))
+                offset += length
+        piles = []
+        for _ in range(4):
+            length = data[offset]
+            piles.append(bytearray(data[offset + 1:offset + 1 + length]))
+            offset += 1 + length
+        table.stacks = piles[:2]
+        table.winning_piles = piles[2:]
+        return table
+
+    def save(self, path):
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(self.to_bytes())
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+def local_ip():
+    """Address to advertise in the UDP broadcast."""
+    try:
+        # Try to get actual IP, fallback to localhost
+        ip = socket.gethostbyname(socket.gethostname())
+        if ip.startswith('127.'):
+            # If we got localhost, try a different approach
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                s.connect(("8.8.8.8", 80))
+                ip = s.getsockname()[0]
+    except:
+        ip = '127.0.0.1'
+    return ip
+
 def send_msg(sock, data):
     try:
         msg = pickle.dumps(data)
@@ -62,28 +254,32 @@ def recvall(sock, n):
     return data
 
 class WarGameServer:
-    def __init__(self):
+    def __init__(self, host=HOST, port=PORT):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((HOST, PORT))
+        self.server_socket.bind((host, port))
         self.server_socket.listen(5)
-        print(f"Server listening on {HOST}:{PORT}")
+        self.port = self.server_socket.getsockname()[1]
+        print(f"Server listening on {host}:{self.port}")
 
         self.clients = [None, None]
-        self.client_names = [None, None]
         self.name_to_index = {}
-        # Use deque for efficient pop from front
-        self.stacks = [deque(), deque()]
-        self.winning_piles = [deque(), deque()]
-        self.ready_flags = [threading.Event(), threading.Event()]
+        self.table = TableState()
+        # Guards hibernating and waking the table
+        self.table_lock = threading.RLock()
+        # Signalled whenever a ready bit in the table changes
+        self.ready_changed = threading.Condition(self.table_lock)
+        self.last_activity = time.time()
         self.client_threads = []
-        self.heartbeat_times = [time.time(), time.time()]
-        self.reconnect_deadlines = [None, None]
         self.disconnected = threading.Event()
         self.game_started = False
-        self.current_round = 0
         self.heartbeat_interval = 20  # Increased from 15 for more tolerance
         self.reconnect_timeout = 120
+        self.hibernate_after = 30  # Idle seconds before the table is spilled to disk
+        self.spill_dir = 'table_spill'
+        self.spill_path = os.path.join(self.spill_dir, f"table_{self.port}.bin")
+        self.table_lost = False  # Set if a hibernated table could not be restored
+        self.round_odds = None
         self.udp_socket = None
         self.broadcast_thread = None
 
@@ -92,18 +288,7 @@ class WarGameServer:
             try:
                 self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                 self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-                try:
-                    # Try to get actual IP, fallback to localhost
-                    local_ip = socket.gethostbyname(socket.gethostname())
-                    if local_ip.startswith('127.'):
-                        # If we got localhost, try a different approach
-                        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                            s.connect(("8.8.8.8", 80))
-                            local_ip = s.getsockname()[0]
-                except:
-                    local_ip = '127.0.0.1'
-                
-                message = f"{local_ip}:{PORT}".encode()
+                message = f"{local_ip()}:{self.port}".encode()
 
                 while not self.disconnected.is_set():
                     try:
@@ -139,37 +324,47 @@ class WarGameServer:
                     continue
                 
                 name = data.get("name", f"Player {connected_players + 1}")
+                if not valid_name(name):
+                    send_msg(conn, {"type": "error", "msg": f"Player name must be 1 to {MAX_NAME_LENGTH} characters."})
+                    conn.close()
+                    continue
                 
                 # Handle reconnection
                 if name in self.name_to_index:
                     index = self.name_to_index[name]
-                    if self.reconnect_deadlines[index] and time.time() > self.reconnect_deadlines[index]:
-                        send_msg(conn, {"type": "error", "msg": "Reconnection window expired. Game already concluded."})
-                        conn.close()
-                        continue
-                    
-                    print(f"{name} is reconnecting.")
-                    self.clients[index] = conn
-                    self.heartbeat_times[index] = time.time()
-                    self.reconnect_deadlines[index] = None
-                    
-                    # Send comprehensive reconnection data
-                    reconnect_data = {
-                        "type": "resume",
-                        "player_index": index,
-                        "stack": list(self.stacks[index]),
-                        "round": self.current_round,
-                        "opponent": self.client_names[1 - index]
-                    }
+                    with self.table_lock:
+                        table = self.wake_table()
+                        if table is None:
+                            send_msg(conn, {"type": "error", "msg": "Game state was lost. Game already concluded."})
+                            conn.close()
+                            continue
+                        if table.reconnect_deadlines[index] and time.time() > table.reconnect_deadlines[index]:
+                            send_msg(conn, {"type": "error", "msg": "Reconnection window expired. Game already concluded."})
+                            conn.close()
+                            continue
+
+                        print(f"{name} is reconnecting.")
+                        self.clients[index] = conn
+                        table.heartbeat_times[index] = time.time()
+                        table.reconnect_deadlines[index] = 0.0
+
+                        # Send comprehensive reconnection data
+                        reconnect_data = {
+                            "type": "resume",
+                            "player_index": index,
+                            "stack": table.stack_cards(index),
+                            "round": table.current_round,
+                            "opponent": table.names[1 - index]
+                        }
                     send_msg(conn, reconnect_data)
                     continue
                 
                 # New player connection
                 if connected_players < 2:
-                    self.client_names[connected_players] = name
+                    self.table.names[connected_players] = name
                     self.name_to_index[name] = connected_players
                     self.clients[connected_players] = conn
-                    self.heartbeat_times[connected_players] = time.time()
+                    self.table.heartbeat_times[connected_players] = time.time()
                     
                     # Send initial connection confirmation
                     init_data = {
@@ -205,14 +400,16 @@ class WarGameServer:
 
     def heartbeat_monitor(self):
         while not self.disconnected.is_set():
-            now = time.time()
-            for i in range(2):
-                if (self.clients[i] and 
-                    (now - self.heartbeat_times[i] > self.heartbeat_interval) and
-                    not self.reconnect_deadlines[i]):  # Don't timeout if already disconnected
-                    player_name = self.client_names[i] if self.client_names[i] else f"Player {i}"
-                    print(f"Heartbeat timeout for {player_name}")
-                    self.handle_disconnect(i)
+            with self.table_lock:
+                table = self.table
+                # Hibernated tables are checked again on wake-up
+                for i in range(2 if table is not None else 0):
+                    if (self.clients[i] and 
+                        (time.time() - table.heartbeat_times[i] > self.heartbeat_interval) and
+                        not table.reconnect_deadlines[i]):  # Don't timeout if already disconnected
+                        player_name = table.names[i] if table.names[i] else f"Player {i}"
+                        print(f"Heartbeat timeout for {player_name}")
+                        self.handle_disconnect(i)
             time.sleep(5)
 
     def start_client_threads(self):
@@ -230,11 +427,27 @@ class WarGameServer:
                 data = recv_msg(self.clients[i])
                 if data == "ready":
                     if self.clients[i]:  # Double-check client is still connected
-                        self.ready_flags[i].set()
+                        with self.ready_changed:
+                            table = self.wake_table()
+                            if table is None:
+                                break
+                            table.set_ready(i)
+                            self.last_activity = time.time()
+                            self.ready_changed.notify_all()
                 elif data == "heartbeat":
-                    self.heartbeat_times[i] = time.time()
+                    with self.table_lock:
+                        if self.table is not None:  # Heartbeats alone don't wake a hibernated table
+                            self.table.heartbeat_times[i] = time.time()
+                elif data == "odds":
+                    with self.table_lock:
+                        table = self.wake_table()
+                        if table is None:
+                            break
+                        table.request_odds(i)
                 elif data == "shutdown":
-                    player_name = self.client_names[i] if self.client_names[i] else f"Player {i}"
+                    with self.table_lock:
+                        table = self.wake_table()
+                        player_name = table.names[i] if table and table.names[i] else f"Player {i}"
                     print(f"{player_name} requested shutdown.")
                     self.send_all({
                         "type": "game_end",
@@ -246,22 +459,27 @@ class WarGameServer:
                     self.handle_disconnect(i)
                     break
             except Exception as e:
-                player_name = self.client_names[i] if self.client_names[i] else f"Player {i}"
+                with self.table_lock:
+                    table = self.wake_table()
+                    player_name = table.names[i] if table and table.names[i] else f"Player {i}"
                 print(f"Error with {player_name}: {e}")
                 self.handle_disconnect(i)
                 break
             
     def handle_disconnect(self, i):
-        if self.clients[i]:  # Only handle if not already disconnected
-            player_name = self.client_names[i] if self.client_names[i] else f"Player {i}"
-            print(f"{player_name} disconnected.")
-            self.reconnect_deadlines[i] = time.time() + self.reconnect_timeout
-            try:
-                self.clients[i].close()
-            except:
-                pass
-            self.clients[i] = None
-            self.ready_flags[i].clear()  # Clear ready flag on disconnect
+        with self.table_lock:
+            table = self.wake_table()
+            if self.clients[i]:  # Only handle if not already disconnected
+                player_name = table.names[i] if table and table.names[i] else f"Player {i}"
+                print(f"{player_name} disconnected.")
+                try:
+                    self.clients[i].close()
+                except:
+                    pass
+                self.clients[i] = None
+                if table is not None:
+                    table.reconnect_deadlines[i] = time.time() + self.reconnect_timeout
+                    table.clear_ready(i)  # Clear ready flag on disconnect
 
     def send_all(self, data):
         disconnected_clients = []
@@ -274,24 +492,140 @@ class WarGameServer:
         for i in disconnected_clients:
             self.handle_disconnect(i)
 
+    def send_round_result(self, round_result, odds):
+        # Like send_all, but only players who asked for odds get them
+        disconnected_clients = []
+        for i, conn in enumerate(self.clients):
+            if conn:
+                data = round_result
+                if odds is not None and self.table.wants_odds(i):
+                    data = dict(round_result, odds=odds)
+                if not send_msg(conn, data):
+                    disconnected_clients.append(i)
+
+        for i in disconnected_clients:
+            self.handle_disconnect(i)
+
+    def wait_for_ready(self, i, timeout):
+        deadline = time.time() + timeout
+        with self.ready_changed:
+            while True:
+                if self.table is not None and self.table.is_ready(i):
+                    return True
+                if self.disconnected.is_set():
+                    return False
+                now = time.time()
+                if now >= deadline:
+                    return False
+                wait_time = deadline - now
+                if self.table is not None:
+                    idle_left = self.last_activity + self.hibernate_after - now
+                    if idle_left <= 0:
+                        self.hibernate_table()
+                    else:
+                        wait_time = min(wait_time, idle_left)
+                self.ready_changed.wait(wait_time)
+
+    def hibernate_table(self):
+        with self.table_lock:
+            if self.table is None or self.disconnected.is_set():
+                return
+            try:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self.table.save(self.spill_path)
+            except Exception as e:
+                print(f"Hibernation failed, keeping table in memory: {e}")
+                self.last_activity = time.time()
+                return
+            self.table = None
+            print(f"Table idle for {self.hibernate_after}s, hibernated to {self.spill_path}.")
+
+    def wake_table(self):
+        """Return the table, loading it back if hibernated; None if it was lost."""
+        with self.table_lock:
+            if self.table is None and not self.table_lost:
+                start = time.perf_counter()
+                try:
+                    table = TableState.load(self.spill_path)
+                except (OSError, struct.error, IndexError, ValueError) as e:
+                    print(f"Waking table failed, ending game: {e}")
+                    self.table_lost = True
+                    self.disconnected.set()
+                    self.ready_changed.notify_all()
+                    self.send_all({"type": "game_end", "message": "Game state could not be restored. Game over."})
+                    return None
+                # Heartbeats were not tracked while hibernated
+                now = time.time()
+                for i in range(2):
+                    table.heartbeat_times[i] = now
+                self.table = table
+                try:
+                    os.remove(self.spill_path)
+                except OSError:
+                    pass
+                # Restart the idle clock so wait_for_ready can hibernate it again
+                self.last_activity = time.time()
+                self.ready_changed.notify_all()
+                print(f"Table woke from hibernation in {(time.perf_counter() - start) * 1000:.2f} ms.")
+            return self.table
+
     def refill_stack_if_needed(self, i):
-        if not self.stacks[i] and self.winning_piles[i]:
-            self.stacks[i] = self.winning_piles[i]
-            random.shuffle(self.stacks[i])
-            self.winning_piles[i] = deque()
+        self.table.refill_stack_if_needed(i)
 
     def check_game_end(self):
-        for i in range(2):
-            if len(self.stacks[i]) == 0 and len(self.winning_piles[i]) == 0:
-                winner_idx = 1 - i
-                self.send_all({
-                    "type": "game_end",
-                    "winner": self.client_names[winner_idx],
-                    "loser": self.client_names[i],
-                    "message": f"{self.client_names[i]} is out of cards. {self.client_names[winner_idx]} wins!"
-                })
-                return True
-        return False
+        i = self.table.out_of_cards()
+        if i is None:
+            return False
+        winner_idx = 1 - i
+        self.send_all({
+            "type": "game_end",
+            "winner": self.table.names[winner_idx],
+            "loser": self.table.names[i],
+            "message": f"{self.table.names[i]} is out of cards. {self.table.names[winner_idx]} wins!"
+        })
+        return True
+
+    def run_round(self):
+        """Play a round and send its result; False if it ended the game.
+
+        Kept out of game_loop so nothing from the round still refers to the
+        table's cards while the next wait may hibernate it.
+        """
+        cards, winner_idx, pot_size, war_count = self.table.play_round()
+        for n in range(war_count):
+            print(f"WAR! Round {n + 1}")
+        names = self.table.names
+        if cards is None:
+            loser_idx = 1 - winner_idx
+            self.send_all({
+                "type": "game_end",
+                "winner": names[winner_idx],
+                "loser": names[loser_idx],
+                "message": f"WAR! {names[loser_idx]} cannot continue. {names[winner_idx]} wins!"
+            })
+            return False
+
+        # Send round result to all players
+        round_result = {
+            "type": "round_result",
+            "cards": cards,
+            "winner_index": winner_idx,
+            "winner_name": names[winner_idx],
+            "pot_size": pot_size,
+            "war_count": war_count
+        }
+        # Odds at the start of the round, only if they are already known
+        odds = None
+        if self.round_odds and self.round_odds.done():
+            if self.round_odds.exception():
+                print(f"Odds estimate failed: {self.round_odds.exception()}")
+            else:
+                odds = list(self.round_odds.result())
+        if self.round_odds:
+            self.round_odds.cancel()  # Don't let a stale estimate hold up the next one
+        self.round_odds = None
+        self.send_round_result(round_result, odds)
+        return True
 
     def game_loop(self):
         self.game_started = True
@@ -306,7 +640,7 @@ class WarGameServer:
                 if self.clients[connected_player]:
                     self.send_all({
                         "type": "game_end",
-                        "message": f"Opponent disconnected. {self.client_names[connected_player]} wins by default!"
+                        "message": f"Opponent disconnected. {self.table.names[connected_player]} wins by default!"
                     })
                 self.disconnected.set()
                 return
@@ -315,12 +649,24 @@ class WarGameServer:
             for i in range(2):
                 self.refill_stack_if_needed(i)
 
-            print(f"Round {self.current_round + 1}: Waiting for both players to be ready...")
-            self.current_round += 1
+            # Estimate live odds in the pool while players get ready
+            if self.table.odds_wanted:
+                try:
+                    self.round_odds = shared_engine().submit(*self.table.card_values())
+                except Exception as e:
+                    # Odds are optional; the engine replaces a broken pool itself
+                    print(f"Odds estimate failed: {e}")
+                    self.round_odds = None
+
+            print(f"Round {self.table.current_round + 1}: Waiting for both players to be ready...")
+            self.table.current_round += 1
 
             # Wait for both players to be ready with timeout
-            ready1 = self.ready_flags[0].wait(timeout=90)  # Increased timeout
-            ready2 = self.ready_flags[1].wait(timeout=90)
+            self.last_activity = time.time()
+            ready1 = self.wait_for_ready(0, timeout=90)  # Increased timeout
+            ready2 = self.wait_for_ready(1, timeout=90)
+            if self.disconnected.is_set():
+                return
 
             if not ready1 or not ready2:
                 timeout_msg = "Timeout: One or both players did not respond in time. Game over."
@@ -329,52 +675,13 @@ class WarGameServer:
                 return
 
             # Clear ready flags
-            self.ready_flags[0].clear()
-            self.ready_flags[1].clear()
+            with self.ready_changed:
+                self.table.ready = 0
 
             # Play the round
             try:
-                cards_in_play = [self.stacks[i].popleft() for i in range(2)]
-                pot = list(cards_in_play)
-
-                # Handle war (tie) situations
-                war_count = 0
-                while card_value(cards_in_play[0]) == card_value(cards_in_play[1]):
-                    war_count += 1
-                    print(f"WAR! Round {war_count}")
-                    
-                    for i in range(2):
-                        self.refill_stack_if_needed(i)
-                        if len(self.stacks[i]) < 2:
-                            winner_idx = 1 - i
-                            self.send_all({
-                                "type": "game_end",
-                                "winner": self.client_names[winner_idx],
-                                "loser": self.client_names[i],
-                                "message": f"WAR! {self.client_names[i]} cannot continue. {self.client_names[winner_idx]} wins!"
-                            })
-                            return
-                        
-                        # Add face-down card and face-up card
-                        pot.append(self.stacks[i].popleft())  # Face down
-                        cards_in_play[i] = self.stacks[i].popleft()  # Face up
-                        pot.append(cards_in_play[i])
-
-                # Determine winner
-                winner_idx = 0 if card_value(cards_in_play[0]) > card_value(cards_in_play[1]) else 1
-                self.winning_piles[winner_idx].extend(pot)
-                
-                # Send round result to all players
-                round_result = {
-                    "type": "round_result",
-                    "cards": cards_in_play,
-                    "winner_index": winner_idx,
-                    "winner_name": self.client_names[winner_idx],
-                    "pot_size": len(pot),
-                    "war_count": war_count
-                }
-                self.send_all(round_result)
-
+                if not self.run_round():
+                    return
             except Exception as e:
                 print(f"Error during game round: {e}")
                 self.send_all({"type": "game_end", "message": "Game error occurred. Ending game."})
@@ -385,6 +692,13 @@ class WarGameServer:
     def cleanup(self):
         print("Cleaning up connections.")
         self.disconnected.set()
+
+        # Drop any spilled table state
+        for path in (self.spill_path, self.spill_path + '.tmp'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
         
         # Close all client connections
         for conn in self.clients:
@@ -399,7 +713,7 @@ class WarGameServer:
             self.server_socket.close()
         except:
             pass
-        
+
         # Close UDP socket
         if self.udp_socket:
             try:
@@ -415,16 +729,15 @@ class WarGameServer:
             # Deal cards
             deck = create_deck()
             random.shuffle(deck)
-            self.stacks[0] = deque(deck[:26])
-            self.stacks[1] = deque(deck[26:])
+            self.table.deal(deck)
 
             # Send initial game data to both players
             for i in range(2):
                 if self.clients[i]:
                     game_start_data = {
                         "type": "game_start",
-                        "stack": list(self.stacks[i]),
-                        "opponent": self.client_names[1 - i]
+                        "stack": self.table.stack_cards(i),
+                        "opponent": self.table.names[1 - i]
                     }
                     send_msg(self.clients[i], game_start_data)
 
@@ -0,0 +1,323 @@
+import atexit
+import multiprocessing
+import random
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from math import factorial, prod
+
+# States are keyed by card values only (suits never decide a round), as
+# (stack 0, sorted pile 0, stack 1, sorted pile 1). Winning piles are shuffled
+# before they are played, so their order does not matter.
+
+def state_key(stacks, winning_piles):
+    """Canonical key for two stacks and two winning piles of card values."""
+    return (bytes(stacks[0]), bytes(sorted(winning_piles[0])),
+            bytes(stacks[1]), bytes(sorted(winning_piles[1])))
+
+def _refill(stacks, piles, rng, i):
+    if not stacks[i] and piles[i]:
+        stacks[i] = piles[i]
+        rng.shuffle(stacks[i])
+        piles[i] = bytearray()
+
+def _rollout(key, rng, max_rounds):
+    """Play one game to the end with the server's rules; the winner's index, or None."""
+    stacks = [bytearray(key[0]), bytearray(key[2])]
+    piles = [bytearray(key[1]), bytearray(key[3])]
+    for _ in range(max_rounds):
+        for i in range(2):
+            if not stacks[i] and not piles[i]:
+                return 1 - i
+        for i in range(2):
+            _refill(stacks, piles, rng, i)
+
+        cards = [stacks[0].pop(0), stacks[1].pop(0)]
+        pot = bytearray(cards)
+        while cards[0] == cards[1]:
+            for i in range(2):
+                _refill(stacks, piles, rng, i)
+                if len(stacks[i]) < 2:
+                    return 1 - i
+                pot.append(stacks[i].pop(0))
+                cards[i] = stacks[i].pop(0)
+                pot.append(cards[i])
+        piles[0 if cards[0] > cards[1] else 1].extend(pot)
+    return None
+
+def _rollout_batch(key, rollouts, seed, max_rounds):
+    """Win counts for both players over a batch of rollouts."""
+    rng = random.Random(seed)
+    wins = [0, 0]
+    for _ in range(rollouts):
+        winner = _rollout(key, rng, max_rounds)
+        if winner is not None:
+            wins[winner] += 1
+    return wins
+
+# Refilling from a pile with more distinct orders than this gives up on the
+# exact search, since large piles blow up factorially.
+MAX_ORDERS = 720
+
+class _SearchTooLarge(Exception):
+    pass
+
+def _order_count(pile):
+    """Number of distinct orders of a pile, without listing them."""
+    return factorial(len(pile)) // prod(factorial(n) for n in Counter(pile).values())
+
+def _distinct_orders(counts, length):
+    if not length:
+        yield b''
+        return
+    for value in list(counts):
+        if counts[value]:
+            counts[value] -= 1
+            for rest in _distinct_orders(counts, length - 1):
+                yield bytes((value,)) + rest
+            counts[value] += 1
+
+@lru_cache(maxsize=1024)
+def _orders(pile):
+    """Every distinct order a shuffled pile can come out in, all equally likely."""
+    if _order_count(pile) > MAX_ORDERS:
+        raise _SearchTooLarge
+    return tuple(_distinct_orders(Counter(pile), len(pile)))
+
+def _refills(stacks, piles, i):
+    if stacks[i] or not piles[i]:
+        yield 1.0, stacks, piles
+        return
+    orders = _orders(piles[i])
+    for order in orders:
+        new_stacks = list(stacks)
+        new_stacks[i] = order
+        new_piles = list(piles)
+        new_piles[i] = b''
+        yield 1.0 / len(orders), new_stacks, new_piles
+
+def _resolve(stacks, piles, cards, pot, prob):
+    if cards[0] != cards[1]:
+        winner = 0 if cards[0] > cards[1] else 1
+        piles = list(piles)
+        piles[winner] = bytes(sorted(piles[winner] + pot))
+        yield prob, (stacks[0], piles[0], stacks[1], piles[1])
+    else:
+        yield from _war(stacks, piles, cards, pot, 0, prob)
+
+def _war(stacks, piles, cards, pot, i, prob):
+    if i == 2:
+        yield from _resolve(stacks, piles, cards, pot, prob)
+        return
+    for q, new_stacks, new_piles in _refills(stacks, piles, i):
+        if len(new_stacks[i]) < 2:
+            yield prob * q, 1 - i
+            continue
+        face_down, face_up = new_stacks[i][0], new_stacks[i][1]
+        new_stacks = list(new_stacks)
+        new_stacks[i] = new_stacks[i][2:]
+        new_cards = list(cards)
+        new_cards[i] = face_up
+        yield from _war(new_stacks, new_piles, new_cards, pot + bytes((face_down, face_up)), i + 1, prob * q)
+
+def _transitions(key):
+    """Outcomes of one round from a state: (probability, winner index or next state)."""
+    stacks = [key[0], key[2]]
+    piles = [key[1], key[3]]
+    for i in range(2):
+        if not stacks[i] and not piles[i]:
+            return [(1.0, 1 - i)]
+    outcomes = {}
+    for q0, stacks0, piles0 in _refills(stacks, piles, 0):
+        for q1, stacks1, piles1 in _refills(stacks0, piles0, 1):
+            cards = [stacks1[0][0], stacks1[1][0]]
+            rest = [stacks1[0][1:], stacks1[1][1:]]
+            for prob, outcome in _resolve(rest, piles1, cards, bytes(cards), q0 * q1):
+                outcomes[outcome] = outcomes.get(outcome, 0.0) + prob
+    return [(prob, outcome) for outcome, prob in outcomes.items()]
+
+def _solve_exact(key, max_states, tolerance=1e-9, max_sweeps=10000):
+    """Exact win probabilities over the reachable state graph, or None if it is too big."""
+    graph = {}
+    frontier = [key]
+    while frontier:
+        state = frontier.pop()
+        if state in graph:
+            continue
+        if len(graph) >= max_states:
+            return None
+        try:
+            graph[state] = _transitions(state)
+        except _SearchTooLarge:
+            return None
+        for _, outcome in graph[state]:
+            if isinstance(outcome, tuple) and outcome not in graph:
+                frontier.append(outcome)
+
+    # War can loop, so iterate the win probabilities to a fixed point. States
+    # found last tend to be closest to the end, so they are updated first.
+    values = {state: (0.0, 0.0) for state in graph}
+    order = list(reversed(graph.items()))
+    for _ in range(max_sweeps):
+        delta = 0.0
+        for state, outcomes in order:
+            p0 = p1 = 0.0
+            for prob, outcome in outcomes:
+                if outcome == 0:
+                    p0 += prob
+                elif outcome == 1:
+                    p1 += prob
+                else:
+                    p0 += prob * values[outcome][0]
+                    p1 += prob * values[outcome][1]
+            old = values[state]
+            delta = max(delta, abs(p0 - old[0]), abs(p1 - old[1]))
+            values[state] = (p0, p1)
+        if delta < tolerance:
+            break
+    return values[key]
+
+def _estimate(key, rollouts, exact_states, seed, max_rounds):
+    """Exact odds for a small endgame, falling back to rollouts if its state graph is too big."""
+    odds = _solve_exact(key, exact_states)
+    if odds is None:
+        wins = _rollout_batch(key, rollouts, seed, max_rounds)
+        odds = (wins[0] / rollouts, wins[1] / rollouts)
+    return odds
+
+class OddsEngine:
+    """Estimates each player's chance of winning from a table's cards.
+
+    Endgames where one player holds at most exact_cards cards are solved
+    exactly when their state graph is small enough; everything else uses
+    Monte Carlo rollouts split over a process pool. Results are cached by
+    canonical state key, and concurrent queries for one state share a future.
+    The pool is kept small (one worker by default); servers share one engine
+    per process through shared_engine().
+    """
+
+    def __init__(self, rollouts=2000, batches=4, exact_cards=5, exact_states=5000,
+                 max_rounds=5000, cache_size=4096, workers=1):
+        self.rollouts = rollouts
+        self.batches = batches
+        self.exact_cards = exact_cards
+        self.exact_states = exact_states
+        self.max_rounds = max_rounds
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.pool = self._new_pool()
+
+    def _new_pool(self):
+        # Spawned workers, so they don't inherit the server's sockets and threads
+        return ProcessPoolExecutor(max_workers=self.workers,
+                                   mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, stacks, winning_piles):
+        """Future for (p0, p1), the win probabilities of both players.
+
+        Cancelling the future drops its work that has not started yet. If the
+        work can't be handed to the pool, the future fails with that error.
+        """
+        key = state_key(stacks, winning_piles)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                future = Future()
+                future.set_result(self.cache[key])
+                return future
+            if key in self.pending and not self.pending[key].cancelled():
+                return self.pending[key]
+            future = Future()
+            self.pending[key] = future
+
+        seed = random.getrandbits(64)
+        batch = -(-self.rollouts // self.batches)
+        parts = []
+        try:
+            if self.is_endgame(key):
+                parts.append(self.pool.submit(_estimate, key, self.rollouts, self.exact_states,
+                                              seed, self.max_rounds))
+            else:
+                for n in range(self.batches):
+                    parts.append(self.pool.submit(_rollout_batch, key, batch, seed + n, self.max_rounds))
+        except Exception as e:
+            # Don't leave a future in pending that nothing will ever complete
+            for part in parts:
+                part.cancel()
+            with self.lock:
+                if self.pending.get(key) is future:
+                    del self.pending[key]
+                if isinstance(e, BrokenProcessPool):
+                    # A worker died; start a new pool for the next query
+                    self.pool.shutdown(wait=False, cancel_futures=True)
+                    self.pool = self._new_pool()
+            future.set_exception(e)
+            return future
+        remaining = [len(parts)]
+
+        def part_done(_):
+            with self.lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+                if self.pending.get(key) is future:
+                    del self.pending[key]
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                results = [part.result() for part in parts]
+            except Exception as e:
+                future.set_exception(e)
+                return
+            if len(results) == 1 and isinstance(results[0], tuple):
+                odds = results[0]
+            else:
+                total = batch * len(results)
+                odds = (sum(r[0] for r in results) / total, sum(r[1] for r in results) / total)
+            with self.lock:
+                self.cache[key] = odds
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+            future.set_result(odds)
+
+        def cancel_parts(done):
+            if done.cancelled():
+                for part in parts:
+                    part.cancel()
+
+        for part in parts:
+            part.add_done_callback(part_done)
+        future.add_done_callback(cancel_parts)
+        return future
+
+    def is_endgame(self, key):
+        """Whether a state is small enough to try the exact search first."""
+        return min(len(key[0]) + len(key[1]), len(key[2]) + len(key[3])) <= self.exact_cards
+
+    def estimate(self, stacks, winning_piles):
+        """Blocking version of submit."""
+        return self.submit(stacks, winning_piles).result()
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_engine():
+    """The process-wide OddsEngine, started on first use and closed at exit.
+
+    Every table in the process queries this one engine, so they share its
+    worker and its cache instead of each spawning their own.
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = OddsEngine()
+            atexit.register(_shared.close)
+        return _shared
@@ -0,0 +1,545 @@
+import os
+import pickle
+import random
+import selectors
+import socket
+import struct
+import time
+
+from war_game_server import (HOST, PORT, MAX_NAME_LENGTH, TableState, create_deck,
+                             local_ip, valid_name)
+from war_odds import shared_engine
+
+BROADCAST_PORT = 54545
+MAX_MESSAGE = 64 * 1024  # Client messages are tiny; anything bigger is a bad client
+
+class Connection:
+    """One client socket with its unsent and unparsed bytes."""
+    __slots__ = ('sock', 'inbox', 'outbox', 'name', 'table_id', 'index', 'closing')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        self.name = None
+        self.table_id = None
+        self.index = None
+        self.closing = False  # Close once the outbox is flushed
+
+class Table:
+    """A table as the server holds it; state is None while it is hibernated.
+
+    deadline is when the table needs attention even if nobody speaks: the
+    end of the ready timeout, or of the earliest reconnect window.
+    """
+    __slots__ = ('state', 'conns', 'last_activity', 'deadline', 'round_odds')
+
+    def __init__(self, state, conns):
+        self.state = state
+        self.conns = conns
+        self.last_activity = time.time()
+        self.deadline = 0.0
+        self.round_odds = None
+
+class TableServer:
+    """Runs many tables on one port from a single selector loop.
+
+    Sockets are non-blocking and every table is driven by the events of its
+    players plus a periodic sweep for timeouts and hibernation, so the server
+    uses the same one thread whether it holds ten tables or a hundred thousand.
+    Players are seated in pairs as they arrive.
+    """
+
+    def __init__(self, host=HOST, port=PORT):
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen(128)
+        self.server_socket.setblocking(False)
+        self.port = self.server_socket.getsockname()[1]
+        print(f"Table server listening on {host}:{self.port}")
+
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server_socket, selectors.EVENT_READ)
+        self.tables = {}
+        self.seats = {}  # Player name -> (table_id, index), for reconnects
+        self.waiting = None  # Named connection waiting for an opponent
+        self.next_table_id = 0
+        self.heartbeat_interval = 20
+        self.reconnect_timeout = 120
+        self.ready_timeout = 90
+        self.hibernate_after = 30  # Idle seconds before a table is spilled to disk
+        self.sweep_interval = 5
+        self.next_sweep = 0.0
+        self.spill_dir = 'table_spill'
+        self.udp_socket = None
+        self.broadcast_message = None
+        self.next_broadcast = 0.0
+        self.running = True
+
+    def spill_path(self, table_id):
+        return os.path.join(self.spill_dir, f"table_{self.port}_{table_id}.bin")
+
+    # Event loop
+
+    def serve_forever(self):
+        self.start_udp_broadcast()
+        try:
+            while self.running:
+                self.poll(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def poll(self, timeout):
+        """Handle whatever is ready within timeout seconds, then any due sweep."""
+        for key, mask in self.selector.select(timeout):
+            conn = key.data
+            if conn is None:
+                self.accept_clients()
+                continue
+            if mask & selectors.EVENT_READ:
+                self.read_from(conn)
+            if mask & selectors.EVENT_WRITE and conn.sock:
+                self.flush(conn)
+
+        now = time.time()
+        if now >= self.next_sweep:
+            self.sweep(now)
+            self.next_sweep = now + self.sweep_interval
+        if self.udp_socket and now >= self.next_broadcast:
+            try:
+                self.udp_socket.sendto(self.broadcast_message, ('<broadcast>', BROADCAST_PORT))
+            except Exception as e:
+                print(f"Broadcast error: {e}")
+                self.udp_socket.close()
+                self.udp_socket = None
+            self.next_broadcast = now + 2
+
+    def start_udp_broadcast(self):
+        try:
+            self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self.udp_socket.setblocking(False)
+            self.broadcast_message = f"{local_ip()}:{self.port}".encode()
+        except Exception as e:
+            print(f"UDP broadcast setup failed: {e}")
+            self.udp_socket = None
+
+    def accept_clients(self):
+        while True:
+            try:
+                sock, addr = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print(f"Error accepting client: {e}")
+                return
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, Connection(sock))
+
+    def read_from(self, conn):
+        try:
+            data = conn.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.handle_disconnect(conn)
+            return
+
+        conn.inbox += data
+        while conn.sock and len(conn.inbox) >= 4:
+            size = struct.unpack_from('>I', conn.inbox)[0]
+            if size > MAX_MESSAGE:
+                self.handle_disconnect(conn)
+                return
+            if len(conn.inbox) < 4 + size:
+                return
+            payload = bytes(conn.inbox[4:4 + size])
+            del conn.inbox[:4 + size]
+            try:
+                message = pickle.loads(payload)
+            except Exception as e:
+                print(f"Receive failed: {e}")
+                self.handle_disconnect(conn)
+                return
+            self.handle_message(conn, message)
+
+    def send(self, conn, data):
+        if not conn or not conn.sock or conn.closing:
+            return
+        msg = pickle.dumps(data)
+        conn.outbox += struct.pack('>I', len(msg)) + msg
+        self.flush(conn)
+
+    def flush(self, conn):
+        try:
+            sent = conn.sock.send(conn.outbox)
+            del conn.outbox[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError as e:
+            print(f"Send failed: {e}")
+            self.handle_disconnect(conn)
+            return
+        if conn.closing and not conn.outbox:
+            self.close_connection(conn)
+            return
+        events = selectors.EVENT_READ
+        if conn.outbox:
+            events |= selectors.EVENT_WRITE
+        self.selector.modify(conn.sock, events, conn)
+
+    def close_connection(self, conn):
+        if not conn.sock:
+            return
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        try:
+            conn.sock.close()
+        except:
+            pass
+        conn.sock = None
+
+    def send_and_close(self, conn, data):
+        if not conn or not conn.sock:
+            return
+        self.send(conn, data)
+        if conn.sock:
+            conn.closing = True
+            if not conn.outbox:
+                self.close_connection(conn)
+
+    # Players
+
+    def handle_message(self, conn, data):
+        if conn.name is None:
+            self.handle_name(conn, data)
+            return
+        if conn.table_id is None:
+            # Still in the lobby
+            if data == "shutdown":
+                self.handle_disconnect(conn)
+            return
+
+        table_id, i = conn.table_id, conn.index
+        table = self.tables.get(table_id)
+        if table is None:
+            return
+        if data == "ready":
+            state = self.wake_table(table_id, table)
+            if state is None:
+                return
+            state.set_ready(i)
+            table.last_activity = time.time()
+            if state.ready == 3:
+                state.ready = 0
+                self.play_round(table_id, table)
+        elif data == "heartbeat":
+            if table.state is not None:  # Heartbeats alone don't wake a hibernated table
+                table.state.heartbeat_times[i] = time.time()
+        elif data == "odds":
+            state = self.wake_table(table_id, table)
+            if state is not None:
+                state.request_odds(i)
+        elif data == "shutdown":
+            print(f"{conn.name} requested shutdown.")
+            self.end_table(table_id, {
+                "type": "game_end",
+                "message": f"{conn.name} has quit the game."
+            })
+
+    def handle_name(self, conn, data):
+        if not isinstance(data, dict) or data.get("type") != "name":
+            self.send_and_close(conn, {"type": "error", "msg": "Invalid connection request"})
+            return
+        name = data.get("name")
+        if not valid_name(name):
+            self.send_and_close(conn, {"type": "error", "msg": f"Player name must be 1 to {MAX_NAME_LENGTH} characters."})
+            return
+
+        if name in self.seats:
+            self.reconnect(conn, name)
+            return
+        if self.waiting and self.waiting.name == name:
+            self.send_and_close(conn, {"type": "error", "msg": "That name is already waiting for a game."})
+            return
+
+        conn.name = name
+        index = 0 if self.waiting is None else 1
+        self.send(conn, {"type": "connected", "player_index": index, "name": name})
+        print(f"{name} connected as Player {index}.")
+        if self.waiting is None:
+            self.waiting = conn
+        else:
+            opponent, self.waiting = self.waiting, None
+            self.open_table([opponent, conn], [opponent.name, name])
+
+    def reconnect(self, conn, name):
+        table_id, index = self.seats[name]
+        table = self.tables[table_id]
+        if table.conns[index] is not None:
+            self.send_and_close(conn, {"type": "error", "msg": "That player is already connected."})
+            return
+        state = self.wake_table(table_id, table)
+        if state is None:
+            self.send_and_close(conn, {"type": "error", "msg": "Game state was lost. Game already concluded."})
+            return
+
+        print(f"{name} is reconnecting.")
+        conn.name, conn.table_id, conn.index = name, table_id, index
+        table.conns[index] = conn
+        state.heartbeat_times[index] = time.time()
+        state.reconnect_deadlines[index] = 0.0
+        table.last_activity = time.time()
+        self.reset_deadline(table)
+        self.send(conn, {
+            "type": "resume",
+            "player_index": index,
+            "stack": state.stack_cards(index),
+            "round": state.current_round,
+            "opponent": state.names[1 - index]
+        })
+
+    def handle_disconnect(self, conn):
+        self.close_connection(conn)
+        if conn is self.waiting:
+            self.waiting = None
+        table = self.tables.get(conn.table_id)
+        if table is None or table.conns[conn.index] is not conn:
+            return
+        i = conn.index
+        table.conns[i] = None
+        state = self.wake_table(conn.table_id, table)
+        if state is None:
+            return
+        print(f"{conn.name} disconnected. Waiting {self.reconnect_timeout}s for reconnection.")
+        state.reconnect_deadlines[i] = time.time() + self.reconnect_timeout
+        state.clear_ready(i)
+        self.reset_deadline(table)
+
+    # Tables
+
+    def open_table(self, conns, names):
+        """Deal a new table for two players and start its first round.
+
+        conns may hold None for players that aren't connected yet.
+        """
+        state = TableState()
+        state.names = list(names)
+        deck = create_deck()
+        random.shuffle(deck)
+        state.deal(deck)
+
+        table_id = self.next_table_id
+        self.next_table_id += 1
+        table = Table(state, list(conns))
+        self.tables[table_id] = table
+        for i, name in enumerate(names):
+            self.seats[name] = (table_id, i)
+            conn = table.conns[i]
+            if conn:
+                conn.table_id, conn.index = table_id, i
+                self.send(conn, {
+                    "type": "game_start",
+                    "stack": state.stack_cards(i),
+                    "opponent": names[1 - i]
+                })
+        self.start_round(table_id, table)
+        return table_id
+
+    def end_table(self, table_id, message):
+        table = self.tables.pop(table_id, None)
+        if table is None:
+            return
+        for conn in table.conns:
+            self.send_and_close(conn, message)
+        for name, seat in list(self.seats.items()):
+            if seat[0] == table_id:
+                del self.seats[name]
+        if table.round_odds:
+            table.round_odds.cancel()
+        path = self.spill_path(table_id)
+        for spill in (path, path + '.tmp'):
+            try:
+                os.remove(spill)
+            except OSError:
+                pass
+
+    def reset_deadline(self, table):
+        """Wait on the earliest reconnect window, or the ready timeout if nobody is away."""
+        away = [d for d in table.state.reconnect_deadlines if d]
+        table.deadline = min(away) if away else time.time() + self.ready_timeout
+
+    def start_round(self, table_id, table):
+        state = table.state
+        i = state.out_of_cards()
+        if i is not None:
+            winner_idx = 1 - i
+            self.end_table(table_id, {
+                "type": "game_end",
+                "winner": state.names[winner_idx],
+                "loser": state.names[i],
+                "message": f"{state.names[i]} is out of cards. {state.names[winner_idx]} wins!"
+            })
+            return
+
+        for i in range(2):
+            state.refill_stack_if_needed(i)
+        state.current_round += 1
+        self.reset_deadline(table)
+
+        # Estimate live odds in the pool while players get ready
+        if state.odds_wanted:
+            try:
+                table.round_odds = shared_engine().submit(*state.card_values())
+            except Exception as e:
+                # Odds are optional; the engine replaces a broken pool itself
+                print(f"Odds estimate failed: {e}")
+                table.round_odds = None
+
+    def play_round(self, table_id, table):
+        state = table.state
+        try:
+            cards, winner_idx, pot_size, war_count = state.play_round()
+        except Exception as e:
+            print(f"Error during game round: {e}")
+            self.end_table(table_id, {"type": "game_end", "message": "Game error occurred. Ending game."})
+            return
+        names = state.names
+        if cards is None:
+            loser_idx = 1 - winner_idx
+            self.end_table(table_id, {
+                "type": "game_end",
+                "winner": names[winner_idx],
+                "loser": names[loser_idx],
+                "message": f"WAR! {names[loser_idx]} cannot continue. {names[winner_idx]} wins!"
+            })
+            return
+
+        round_result = {
+            "type": "round_result",
+            "cards": cards,
+            "winner_index": winner_idx,
+            "winner_name": names[winner_idx],
+            "pot_size": pot_size,
+            "war_count": war_count
+        }
+        # Odds at the start of the round, only if they are already known
+        odds = None
+        round_odds, table.round_odds = table.round_odds, None
+        if round_odds and round_odds.done():
+            if round_odds.exception():
+                print(f"Odds estimate failed: {round_odds.exception()}")
+            else:
+                odds = list(round_odds.result())
+        if round_odds:
+            round_odds.cancel()  # Don't let a stale estimate hold up the next one
+        for i, conn in enumerate(table.conns):
+            data = round_result
+            if odds is not None and state.wants_odds(i):
+                data = dict(round_result, odds=odds)
+            self.send(conn, data)
+
+        if table_id in self.tables:
+            self.start_round(table_id, table)
+
+    def sweep(self, now):
+        """Time out silent players and expired tables, and hibernate idle ones."""
+        for table_id, table in list(self.tables.items()):
+            if now >= table.deadline:
+                self.expire_table(table_id, table, now)
+                continue
+            state = table.state
+            if state is None:
+                continue
+            for conn in table.conns:
+                if conn and now - state.heartbeat_times[conn.index] > self.heartbeat_interval:
+                    print(f"Heartbeat timeout for {conn.name}")
+                    self.handle_disconnect(conn)
+            if now - table.last_activity >= self.hibernate_after:
+                self.hibernate_table(table_id, table)
+
+    def expire_table(self, table_id, table, now):
+        state = self.wake_table(table_id, table)
+        if state is None:
+            return
+        away = [i for i in range(2) if state.reconnect_deadlines[i]]
+        if not away:
+            self.end_table(table_id, {
+                "type": "game_end",
+                "message": "Timeout: One or both players did not respond in time. Game over."
+            })
+        elif any(now >= state.reconnect_deadlines[i] for i in away):
+            message = {"type": "game_end", "message": "Reconnection window expired. Game over."}
+            if len(away) == 1:
+                winner_idx = 1 - away[0]
+                message["message"] = f"Opponent disconnected. {state.names[winner_idx]} wins by default!"
+            self.end_table(table_id, message)
+        else:
+            self.reset_deadline(table)
+
+    def hibernate_table(self, table_id, table):
+        path = self.spill_path(table_id)
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            table.state.save(path)
+        except Exception as e:
+            print(f"Hibernation failed, keeping table in memory: {e}")
+            table.last_activity = time.time()
+            return
+        table.state = None
+
+    def wake_table(self, table_id, table):
+        """Return the table's state, loading it back if hibernated; None if it was lost."""
+        if table.state is not None:
+            return table.state
+        path = self.spill_path(table_id)
+        try:
+            state = TableState.load(path)
+        except (OSError, struct.error, IndexError, ValueError) as e:
+            print(f"Waking table {table_id} failed, ending its game: {e}")
+            self.end_table(table_id, {"type": "game_end", "message": "Game state could not be restored. Game over."})
+            return None
+        # Heartbeats were not tracked while hibernated
+        now = time.time()
+        for i in range(2):
+            state.heartbeat_times[i] = now
+        table.state = state
+        table.last_activity = now
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return state
+
+    def close(self):
+        print("Cleaning up connections.")
+        self.running = False
+        for table_id in list(self.tables):
+            path = self.spill_path(table_id)
+            for spill in (path, path + '.tmp'):
+                try:
+                    os.remove(spill)
+                except OSError:
+                    pass
+        for key in list(self.selector.get_map().values()):
+            if key.data:
+                self.close_connection(key.data)
+        self.selector.close()
+        try:
+            self.server_socket.close()
+        except:
+            pass
+        if self.udp_socket:
+            self.udp_socket.close()
+            self.udp_socket = None
+
+if __name__ == '__main__':
+    server = TableServer()
+    server.serve_forever()